@@ -1,5 +1,9 @@
 import os
-import json
+import time
+import atexit
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, current_app
 from config import Config
 from app.models.a_acces import A_ACCES
@@ -12,11 +16,29 @@ from app.models.recherche import RECHERCHE
 from app.models.role import ROLE
 from app.models.sous_dossier import SOUS_DOSSIER
 from app.models.utilisateur import UTILISATEUR
-from app.utils import check_notitications, get_total_file_count, get_total_file_count_by_id
+from app.utils import Whoosh, check_notitications, get_total_file_count, get_total_file_count_by_id, get_file_counts, get_folder_tree_for_role
 from app.models.lien import LIEN
+from app.decorators import request_cached
 from app.extensions import redis, socketio, crsf, login_manager, celery, db, compress
 
 def create_app(config_class = Config, is_worker=False):
+    storage_path = config_class.STORAGE_PATH
+    for directory in ('files', 'screenshots', 'database', 'redis'):
+        os.makedirs(f'{storage_path}/storage/{directory}', exist_ok=True)
+
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    app.storage_path = storage_path
+    db.init_app(app)
+
+    celery.conf.update(app.config)
+
+    redis.init_app(app)
+
+    # The Celery tasks only need the database and Redis.
+    if is_worker:
+        return app
+
     from app.register import bp as register_bp
     from app.notifications import bp as notifications_bp
     from app.login import bp as login_bp
@@ -27,30 +49,7 @@ def create_app(config_class = Config, is_worker=False):
     from app.desktop import bp as desktop_bp
     from app.password_reset import bp as password_reset_bp
 
-    
-    storage_path = config_class.STORAGE_PATH
-    if not os.path.exists(f'{storage_path}/storage'):
-        os.makedirs(f'{storage_path}/storage')
-    if not os.path.exists(f'{storage_path}/storage/files'):
-        os.makedirs(f'{storage_path}/storage/files')
-    if not os.path.exists(f'{storage_path}/storage/screenshots'):
-        os.makedirs(f'{storage_path}/storage/screenshots')
-    if not os.path.exists(f'{storage_path}/storage/database'):
-        os.makedirs(f'{storage_path}/storage/database')
-    if not os.path.exists(f'{storage_path}/storage/redis'):
-        os.makedirs(f'{storage_path}/storage/redis')
-    if not os.path.exists(f'{storage_path}/storage/password'):
-        os.makedirs(f'{storage_path}/storage/password')
-    json_file_path = f'{storage_path}/storage/password/password.json'
-    if not os.path.exists(json_file_path):
-        with open(json_file_path, 'w') as json_file:
-            json.dump({}, json_file)
-
-    app = Flask(__name__)
-    app.config.from_object(config_class)
-    app.storage_path = storage_path
     crsf.init_app(app)
-    db.init_app(app)
     with app.app_context():
         db.create_all()
         fill_db()
@@ -60,43 +59,68 @@ def create_app(config_class = Config, is_worker=False):
 
     socketio.init_app(app)
 
-    celery.conf.update(app.config)
-
-    redis.init_app(app)
-
     compress.init_app(app)
 
-    if not is_worker:
-        def handle_worker_status_message(message):
-            data = json.loads(message['data'].decode('utf-8'))
-            socketio.emit('worker_status', data, namespace='/administration')
-
-        def handle_process_status_message(_):
-            with app.app_context():
-                total_files = FICHIER.query.count()
-                total_files_processed = FICHIER.query.filter(FICHIER.est_Indexe_Fichier == 1).count()
-                socketio.emit('total_files', total_files, namespace='/administration')
-                socketio.emit('total_files_processed', total_files_processed, namespace='/administration')
-
-        def handle_index_verification_message(message):
-            data = json.loads(message['data'].decode('utf-8'))
-            socketio.emit('index_verification_success',
-                          {'message': data['message']},
-                          namespace='/administration',
-                          room=f'user_{data['user']}')
-
-        pubsub = redis.pubsub()
-        pubsub.subscribe(**{'worker_status': handle_worker_status_message})
-        pubsub.subscribe(**{'process_status': handle_process_status_message})
-        pubsub.subscribe(**{'file_processed': lambda message: socketio.emit('file_processed', json.loads(message['data'].decode('utf-8')), namespace='/notifications')})
-        pubsub.subscribe(**{'index_verification_success': handle_index_verification_message})
-        pubsub.run_in_thread(sleep_time=0.5)
+    status_executor = ThreadPoolExecutor(max_workers=2)
+    process_status_pending = threading.Event()
+
+    def handle_worker_status_message(message):
+        data = orjson.loads(message['data'])
+        socketio.emit('worker_status', data, namespace='/administration')
+
+    def emit_process_status():
+        # Let the burst of status messages settle so that it is answered by a single query.
+        time.sleep(1)
+        process_status_pending.clear()
+        with app.app_context():
+            total_files, total_files_processed = get_file_counts()
+            socketio.emit('total_files', total_files, namespace='/administration')
+            socketio.emit('total_files_processed', total_files_processed, namespace='/administration')
+
+    def handle_process_status_message(_):
+        if not process_status_pending.is_set():
+            process_status_pending.set()
+            status_executor.submit(emit_process_status)
+
+    def handle_file_processed_message(message):
+        socketio.emit('file_processed', orjson.loads(message['data']), namespace='/notifications')
+
+    def handle_index_verification_message(message):
+        data = orjson.loads(message['data'])
+        socketio.emit('index_verification_success',
+                      {'message': data['message']},
+                      namespace='/administration',
+                      room=f'user_{data['user']}')
+
+    dispatch = {
+        b'worker_status': handle_worker_status_message,
+        b'process_status': handle_process_status_message,
+        b'file_processed': handle_file_processed_message,
+        b'index_verification_success': handle_index_verification_message,
+    }
+
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(*dispatch)
+
+    def listen():
+        try:
+            for message in pubsub.listen():
+                if message['type'] == 'message':
+                    dispatch[message['channel']](message)
+        finally:
+            pubsub.close()
+
+    threading.Thread(target=listen, daemon=True).start()
+    atexit.register(pubsub.unsubscribe)
+
+    with app.app_context():
+        prewarm()
 
     @app.context_processor
     def utility_processor():
-        return dict(get_total_file_count=get_total_file_count,
-                    get_total_file_count_by_id=get_total_file_count_by_id,
-                    check_notitications=check_notitications)
+        return dict(get_total_file_count=request_cached(get_total_file_count),
+                    get_total_file_count_by_id=request_cached(get_total_file_count_by_id),
+                    check_notitications=request_cached(check_notitications))
 
     app.register_blueprint(register_bp, url_prefix='/inscription')
     app.register_blueprint(notifications_bp, url_prefix='/notifications')
@@ -109,35 +133,53 @@ def create_app(config_class = Config, is_worker=False):
     app.register_blueprint(password_reset_bp, url_prefix='/reinitialisation')
     return app
 
+def prewarm():
+    # Open the search index and build the folder trees so that the first requests find them ready.
+    Whoosh().searcher()
+    for role_id in db.session.scalars(db.select(ROLE.id_Role)):
+        get_folder_tree_for_role(role_id)
+
 def fill_db():
-    if not ROLE.query.all():
-        db.session.add(ROLE(nom_Role="ADMIN"))
-        db.session.add(ROLE(nom_Role="RCH4"))
-        db.session.add(ROLE(nom_Role="RCH3"))
-        db.session.add(ROLE(nom_Role="RCH1/2"))
-        db.session.commit()
-
-    if not DOSSIER.query.all():
-        db.session.add(DOSSIER(nom_Dossier="Décret / Circulaire", priorite_Dossier=1, couleur_Dossier="#ffffcc"))
-        db.session.add(DOSSIER(nom_Dossier="GDO / GTO", priorite_Dossier=2, couleur_Dossier="#ffcc99"))
-        db.session.add(DOSSIER(nom_Dossier="DTO / NDS", priorite_Dossier=3, couleur_Dossier="#ffcccc"))
-        db.session.add(DOSSIER(nom_Dossier="PEX / RETEX / PIO", priorite_Dossier=4, couleur_Dossier="#ff99cc"))
-        db.session.add(DOSSIER(nom_Dossier="Support formation", priorite_Dossier=5, couleur_Dossier="#ffccff"))
-        db.session.add(DOSSIER(nom_Dossier="Mémoire", priorite_Dossier=6, couleur_Dossier="#cc99ff"))
-        db.session.add(DOSSIER(nom_Dossier="Thèse", priorite_Dossier=7, couleur_Dossier="#ccccff"))
-        db.session.add(DOSSIER(nom_Dossier="À trier", priorite_Dossier=8, couleur_Dossier="#ccffff"))
-        db.session.add(DOSSIER(nom_Dossier="Archives", priorite_Dossier=2147483647, couleur_Dossier="#d3d7d8"))
-        db.session.commit()
-
-    if not db.session.query(A_ACCES).all():
-        for dossier in DOSSIER.query.all():
-            db.session.execute(A_ACCES.insert().values(id_Role=1, id_Dossier=dossier.id_Dossier))
-            db.session.execute(A_ACCES.insert().values(id_Role=2, id_Dossier=dossier.id_Dossier))
-            db.session.execute(A_ACCES.insert().values(id_Role=3, id_Dossier=dossier.id_Dossier))
-            db.session.execute(A_ACCES.insert().values(id_Role=4, id_Dossier=dossier.id_Dossier))
-        db.session.commit()
-
-    if not UTILISATEUR.query.all():
+    if not db.session.query(ROLE.id_Role).first():
+        db.session.execute(
+            ROLE.__table__.insert(),
+            [
+                {"nom_Role": "ADMIN"},
+                {"nom_Role": "RCH4"},
+                {"nom_Role": "RCH3"},
+                {"nom_Role": "RCH1/2"},
+            ],
+        )
+
+    if not db.session.query(DOSSIER.id_Dossier).first():
+        db.session.execute(
+            DOSSIER.__table__.insert(),
+            [
+                {"nom_Dossier": "Décret / Circulaire", "priorite_Dossier": 1, "couleur_Dossier": "#ffffcc"},
+                {"nom_Dossier": "GDO / GTO", "priorite_Dossier": 2, "couleur_Dossier": "#ffcc99"},
+                {"nom_Dossier": "DTO / NDS", "priorite_Dossier": 3, "couleur_Dossier": "#ffcccc"},
+                {"nom_Dossier": "PEX / RETEX / PIO", "priorite_Dossier": 4, "couleur_Dossier": "#ff99cc"},
+                {"nom_Dossier": "Support formation", "priorite_Dossier": 5, "couleur_Dossier": "#ffccff"},
+                {"nom_Dossier": "Mémoire", "priorite_Dossier": 6, "couleur_Dossier": "#cc99ff"},
+                {"nom_Dossier": "Thèse", "priorite_Dossier": 7, "couleur_Dossier": "#ccccff"},
+                {"nom_Dossier": "À trier", "priorite_Dossier": 8, "couleur_Dossier": "#ccffff"},
+                {"nom_Dossier": "Archives", "priorite_Dossier": 2147483647, "couleur_Dossier": "#d3d7d8"},
+            ],
+        )
+
+    if not db.session.query(A_ACCES).first():
+        dossier_ids = db.session.scalars(db.select(DOSSIER.id_Dossier)).all()
+        db.session.execute(
+            A_ACCES.insert(),
+            [
+                {"id_Role": role_id, "id_Dossier": dossier_id}
+                for dossier_id in dossier_ids
+                for role_id in (1, 2, 3, 4)
+            ],
+        )
+
+    if not db.session.query(UTILISATEUR.id_Utilisateur).first():
         db.session.add(UTILISATEUR(nom_Utilisateur="Administrateur", prenom_Utilisateur="", email_Utilisateur="admin@admin.fr", mdp_Utilisateur="$2b$12$sOih7qRKimxwqJXITajOfO.Twyg.lModCMYSrgxLpxGompCQjjM56", telephone_Utilisateur="", est_Actif_Utilisateur=1, id_Role=1))
         # password: O]SxR=rBv%
-        db.session.commit()
\ No newline at end of file
+
+    db.session.commit()
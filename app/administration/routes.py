@@ -1,8 +1,8 @@
 from datetime import datetime
 import os
-import json
+import shutil
 import uuid
-from base64 import b64decode
+import orjson
 from app.extensions import redis, socketio, db
 from app.administration import bp
 from app.tasks import process_file, verify_index
@@ -21,7 +21,7 @@ from app.models.role import ROLE
 from app.models.lien import LIEN
 from app.models.a_recherche import A_RECHERCHE
 from app.models.favoris import FAVORIS
-from app.utils import Whoosh, check_notitications
+from app.utils import Whoosh, check_notitications, invalidates_folder_tree, get_file_counts, run_blocking_io, invalidate_user
 from fasteners import InterProcessLock
 from app.mail import send_deactivation_email, send_delete_email
 
@@ -31,23 +31,22 @@ from app.mail import send_deactivation_email, send_delete_email
 @active_required
 @admin_required
 def administration():
-    all_folders = DOSSIER.query.all()
-    all_root_folders = [folder for folder in all_folders if folder.DOSSIER == []]
-    all_root_folders.sort(key=lambda x: x.priorite_Dossier)
-    all_users = UTILISATEUR.query.all()
-    all_users = [user for user in all_users if user.id_Role is not None]
+    all_root_folders = (
+        DOSSIER.query.filter(~DOSSIER.DOSSIER.any())
+        .order_by(DOSSIER.priorite_Dossier)
+        .all()
+    )
+    users_query = UTILISATEUR.query.filter(
+        UTILISATEUR.id_Role.isnot(None),
+        UTILISATEUR.id_Utilisateur != current_user.id_Utilisateur,
+    )
     if current_user.id_Role == 2:
-        all_users = [
-            user
-            for user in all_users
-            if user.id_Role != current_user.id_Role and user.id_Role != 1
-        ]
-    all_users = [
-        user for user in all_users if user.id_Utilisateur != current_user.id_Utilisateur
-    ]
+        users_query = users_query.filter(
+            UTILISATEUR.id_Role != current_user.id_Role, UTILISATEUR.id_Role != 1
+        )
+    all_users = users_query.all()
     all_roles = ROLE.query.all()
-    all_links = LIEN.query.all()
-    all_links = sorted(all_links, key=lambda x: x.nom_Lien.lower())
+    all_links = LIEN.query.order_by(db.func.lower(LIEN.nom_Lien)).all()
     return render_template(
         "administration/index.html",
         folders=all_root_folders,
@@ -66,15 +65,14 @@ def administration():
 @active_required
 @admin_required
 def upload():
-    json_data = request.get_json()
-    folder_id = json_data.get("folderId")
+    folder_id = request.form.get("folderId")
     folder = DOSSIER.query.get(folder_id)
     if folder is None:
         return jsonify({"error": "Le classeur sélectionné n'existe pas."}), 404
-    file_data = json_data.get("data")
-    filename = unidecode(secure_filename(json_data.get("filename"))).lower()
+    file_data = request.files.get("file")
+    filename = unidecode(secure_filename(request.form.get("filename"))).lower()
     existing_file = FICHIER.query.filter_by(nom_Fichier=filename).first()
-    force = json_data.get("force")
+    force = request.form.get("force") == "true"
     if existing_file is not None:
         if not existing_file.est_Indexe_Fichier:
             return (
@@ -110,7 +108,7 @@ def upload():
                 409,
             )
     user_tags = unidecode(
-        " ".join(json_data.get("tags").replace(" ", ";").split(";"))
+        " ".join(request.form.get("tags", "").replace(" ", ";").split(";"))
     ).lower()
     storage_directory = os.path.join(current_app.storage_path, "storage", "files")
     if not os.path.exists(f"{storage_directory}/{folder_id}"):
@@ -130,8 +128,7 @@ def upload():
     current_user_dict = current_user.to_dict_secure()
     file_dict = file.to_dict()
     file_dict.update({"id_Utilisateur": str(file.id_Utilisateur)})
-    with open(file_path, "wb") as new_file:
-        new_file.write(b64decode(file_data.split(",")[1]))
+    run_blocking_io(save_uploaded_file, file_data.stream, file_path)
     process_file.apply_async(
         args=[
             file_path,
@@ -146,7 +143,7 @@ def upload():
         ]
     )
     redis.rpush(
-        "files_queue", json.dumps({"file_id": file.id_Fichier, "filename": filename})
+        "files_queue", orjson.dumps({"file_id": file.id_Fichier, "filename": filename})
     )
     file_dict = file.to_dict()
     file_dict.update(
@@ -162,6 +159,11 @@ def upload():
     return jsonify(file_dict), 200
 
 
+def save_uploaded_file(stream, file_path):
+    with open(file_path, "wb") as new_file:
+        shutil.copyfileobj(stream, new_file, length=1 << 20)
+
+
 @socketio.on("join", namespace="/administration")
 def on_join(data):
     join_room(data["room"])
@@ -171,22 +173,25 @@ def on_join(data):
 def connect():
     if not (current_user.is_authenticated and current_user.is_admin):
         return
-    workers = redis.keys("worker:*") if len(redis.keys("worker:*")) > 0 else []
-    for worker in workers:
-        socketio.emit(
-            "worker_status",
-            json.loads(redis.get(worker).decode("utf-8")),
-            namespace="/administration",
-        )
+    workers = list(redis.scan_iter(match="worker:*", count=500))
+    if workers:
+        for worker_status in redis.mget(workers):
+            if worker_status is not None:
+                socketio.emit(
+                    "worker_status",
+                    orjson.loads(worker_status),
+                    namespace="/administration",
+                )
 
+    total_files, total_files_processed = get_file_counts()
     socketio.emit(
         "total_files",
-        FICHIER.query.count(),
+        total_files,
         namespace="/administration",
     )
     socketio.emit(
         "total_files_processed",
-        FICHIER.query.filter(FICHIER.est_Indexe_Fichier == 1).count(),
+        total_files_processed,
         namespace="/administration",
     )
 
@@ -194,8 +199,7 @@ def connect():
 @socketio.on("search_files", namespace="/administration")
 def search_files(data):
     search_query = data.get("query")
-    with InterProcessLock(f"{current_app.storage_path}/storage/index/whoosh.lock"):
-        search_results = Whoosh().search(search_query, path=f'{data.get("folderId")}')
+    search_results = Whoosh().search(search_query, path=f'{data.get("folderId")}')
     socketio.emit(
         "search_results",
         search_results,
@@ -256,6 +260,7 @@ def update_user_role(data):
         )
         return
     db.session.commit()
+    invalidate_user(user.id_Utilisateur)
     socketio.emit(
         "user_role_updated",
         {**data, "message": "Le rôle de l'utilisateur a été modifié avec succès."},
@@ -315,6 +320,7 @@ def update_user_status(data):
         )
         return
     db.session.commit()
+    invalidate_user(user.id_Utilisateur)
     socketio.emit(
         "user_status_updated",
         {**data, "message": "Le statut de l'utilisateur a été modifié avec succès."},
@@ -434,9 +440,11 @@ def delete_user_database(user_id):
     user = UTILISATEUR.query.get(user_id)
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(user_id)
 
 
 @socketio.on("create_folder", namespace="/administration")
+@invalidates_folder_tree
 def create_folder(data):
     if not current_user.est_Actif_Utilisateur:
         socketio.emit(
@@ -550,6 +558,7 @@ def create_folder(data):
 
 
 @socketio.on("modify_folder", namespace="/administration")
+@invalidates_folder_tree
 def modify_folder(data):
     if not current_user.est_Actif_Utilisateur:
         socketio.emit(
@@ -673,6 +682,7 @@ def modify_folder(data):
 
 
 @socketio.on("delete_folder", namespace="/administration")
+@invalidates_folder_tree
 def delete_folder(data):
     if not current_user.est_Actif_Utilisateur:
         socketio.emit(
@@ -772,6 +782,7 @@ def delete_folder(data):
 
 
 @socketio.on("archive_folders", namespace="/administration")
+@invalidates_folder_tree
 def archive_folders(data):
     if not current_user.est_Actif_Utilisateur:
         socketio.emit(
@@ -871,8 +882,7 @@ def delete_files(data):
             return
     try:
         file_paths = []
-        with InterProcessLock(f"{current_app.storage_path}/storage/index/whoosh.lock"):
-            Whoosh().delete_documents(file_ids)
+        Whoosh().delete_documents(file_ids)
         for file_id in file_ids:
             database_file = FICHIER.query.get(file_id)
             db.session.delete(database_file)
@@ -895,9 +905,7 @@ def delete_files(data):
             room=f"user_{current_user.id_Utilisateur}",
         )
         return
-    for file_path in file_paths:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    run_blocking_io(remove_files, file_paths)
     socketio.emit(
         "files_deleted",
         {"fileIds": file_ids},
@@ -907,20 +915,24 @@ def delete_files(data):
 
 
 def delete_file(file_id):
-    with InterProcessLock(f"{current_app.storage_path}/storage/index/whoosh.lock"):
-        Whoosh().delete_document(file_id)
+    Whoosh().delete_document(file_id)
     database_file = FICHIER.query.get(file_id)
-    db.session.delete(database_file)
-    os.remove(
-        os.path.join(
-            current_app.storage_path,
-            "storage",
-            "files",
-            str(database_file.id_Dossier),
-            f"{file_id}.{database_file.extension_Fichier}",
-        )
+    file_path = os.path.join(
+        current_app.storage_path,
+        "storage",
+        "files",
+        str(database_file.id_Dossier),
+        f"{file_id}.{database_file.extension_Fichier}",
     )
+    db.session.delete(database_file)
     db.session.commit()
+    run_blocking_io(os.remove, file_path)
+
+
+def remove_files(file_paths):
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            os.remove(file_path)
 
 
 @socketio.on("delete_link", namespace="/administration")
@@ -1026,11 +1038,11 @@ def verify_index_socket(data={}):
         )
         return
     force = data.get("force", False)
-    workers = redis.keys("worker:*") if len(redis.keys("worker:*")) > 0 else []
-    for file in redis.lrange("files_queue", 0, -1):
-        file = json.loads(file.decode("utf-8"))
+    workers = list(redis.scan_iter(match="worker:*", count=500))
+    for queued_file in redis.lrange("files_queue", 0, -1):
+        file = orjson.loads(queued_file)
         if FICHIER.query.get(file["file_id"]).est_Indexe_Fichier or len(workers) == 0:
-            redis.lrem("files_queue", 0, json.dumps(file))
+            redis.lrem("files_queue", 0, queued_file)
     if redis.llen("files_queue") > 0:
         if not force:
             socketio.emit(
@@ -1,6 +1,6 @@
 from functools import wraps
 from flask_login import current_user, logout_user
-from flask import abort, redirect, url_for
+from flask import abort, redirect, url_for, g
 
 
 def admin_required(f):
@@ -30,4 +30,20 @@ def active_required(f):
             return redirect(url_for("login.login"))
         return f(*args, **kwargs)
 
+    return decorated_function
+
+def request_cached(f):
+    """
+    Decorator that memoizes a function for the duration of the current request.
+    Repeated calls with the same arguments, e.g. from a template, are only computed once.
+    """
+
+    @wraps(f)
+    def decorated_function(*args):
+        cache = g.setdefault("request_cache", {})
+        key = (f.__name__, args)
+        if key not in cache:
+            cache[key] = f(*args)
+        return cache[key]
+
     return decorated_function
\ No newline at end of file
@@ -4,8 +4,7 @@ from flask import send_from_directory, abort, current_app, request, send_file
 from app.models.fichier import FICHIER
 from flask_login import current_user, login_required
 from app.extensions import socketio, db
-from app.models.favoris import FAVORIS
-from app.utils import FileDownloader
+from app.utils import FileDownloader, get_favorite_ids
 from app.decorators import admin_required, active_required
 from threading import Timer
 from flask_socketio import join_room
@@ -72,12 +71,7 @@ def get_files_details(data):
         if db.session.query(FICHIER).filter(FICHIER.id_Fichier == file_id).first()
         is not None
     ]
-    favoris = (
-        db.session.query(FAVORIS.c.id_Fichier)
-        .filter(FAVORIS.c.id_Utilisateur == current_user.id_Utilisateur)
-        .all()
-    )
-    favoris_ids = [favori.id_Fichier for favori in favoris]
+    favoris_ids = get_favorite_ids(current_user.id_Utilisateur)
     files = []
     for file_id in files_id:
         file = db.session.query(FICHIER).filter(FICHIER.id_Fichier == file_id).first()
@@ -1,17 +1,16 @@
 from app.home import bp
 from flask_login import login_required, current_user
-from flask import render_template, jsonify, request, current_app
+from flask import render_template, jsonify, request
 from app.models.favoris import FAVORIS
 from app.models.fichier import FICHIER
 from app.models.lien import LIEN
 from app.models.a_recherche import A_RECHERCHE
 from app.forms.search_form import SearchForm
 from datetime import datetime
-from app.models.dossier import DOSSIER
-from app.utils import Whoosh, check_notitications
+from collections import defaultdict
+from app.utils import Whoosh, check_notitications, get_folder_tree_for_role
 from app.decorators import active_required
 from app.extensions import socketio, db
-from fasteners import InterProcessLock
 from flask_socketio import join_room
 
 
@@ -31,15 +30,12 @@ def home():
     Returns:
         The rendered home page template.
     """
-    form = SearchForm()
-
     query = ""
-    whoosh = Whoosh()
     form = SearchForm()
     if form.validate_on_submit():
         add_research(current_user.id_Utilisateur, form.search.data)
         query = form.search.data
-    results = whoosh.search(query)
+    results = Whoosh().search(query)
     results = create_rendered_list(results)
     favorite_files = get_files_favoris(current_user.id_Utilisateur)
     researches = get_user_researches(current_user.id_Utilisateur)
@@ -158,30 +154,25 @@ def add_research(user_id, search):
         )
         db.session.add(research)
     db.session.commit()
-    db.session.commit()
 
 
-def create_folder_dict(folder, files):
+def create_folder_dict(folder, files_by_folder):
     """
     Create a dictionary representation of a folder.
 
     Args:
-        folder (Folder): The folder object.
-        files (list): A list of file objects.
+        folder (dict): The cached folder dictionary.
+        files_by_folder (dict): A dictionary mapping folder paths to their file objects.
 
     Returns:
         dict: A dictionary representation of the folder, including its name, files, color, id, and subfolders.
     """
-    files_in_folder = [
-        result for result in files if result["path"] == (str(folder.id_Dossier))
-    ]
-    subfolders = recursive_subfolder(folder, files)
     return {
-        "name": folder.nom_Dossier,
-        "files": files_in_folder,
-        "color": folder.couleur_Dossier,
-        "id": folder.id_Dossier,
-        "subfolder": subfolders,
+        "name": folder["name"],
+        "files": files_by_folder.get(folder["path"], []),
+        "color": folder["color"],
+        "id": folder["id"],
+        "subfolder": recursive_subfolder(folder, files_by_folder),
     }
 
 
@@ -195,44 +186,32 @@ def create_rendered_list(results):
     Returns:
         list: A list of dictionaries representing folders and their associated results.
     """
-    folders = db.session.query(DOSSIER).order_by(DOSSIER.priorite_Dossier).all()
-    folders_root = [
-        folder for folder in folders if folder.DOSSIER == [] and is_accessible(folder)
+    files_by_folder = defaultdict(list)
+    for result in results:
+        files_by_folder[result["path"]].append(result)
+    return [
+        create_folder_dict(folder, files_by_folder)
+        for folder in get_folder_tree_for_role(current_user.id_Role)
     ]
-    return [create_folder_dict(folder, results) for folder in folders_root]
 
 
-def recursive_subfolder(folder, files):
+def recursive_subfolder(folder, files_by_folder):
     """
-    Recursively searches for subfolders in the given folder and creates a list of dictionaries
-    containing information about each subfolder.
+    Recursively creates a list of dictionaries containing information about each subfolder
+    of the given folder.
 
     Args:
-        folder (str): The path of the folder to search for subfolders.
-        files (list): A list of files to include in the dictionaries.
+        folder (dict): The cached folder dictionary.
+        files_by_folder (dict): A dictionary mapping folder paths to their file objects.
 
     Returns:
         list: A list of dictionaries containing information about each subfolder.
     """
     return [
-        create_folder_dict(subfolder, files)
-        for subfolder in folder.DOSSIER_
-        if is_accessible(subfolder)
+        create_folder_dict(subfolder, files_by_folder)
+        for subfolder in folder["subfolder"]
     ]
 
-
-def is_accessible(folder):
-    """
-    Check if the current user has access to the given folder.
-
-    Args:
-        folder (Folder): The folder to check.
-
-    Returns:
-        bool: True if the user has access to the folder, False otherwise.
-    """
-    return any(current_user.id_Role == role.id_Role for role in folder.ROLE)
-
 @socketio.on("join", namespace="/home")
 def on_join(data):
     """
@@ -258,9 +237,8 @@ def search_files(data):
         None
     """
     search_query = data.get("query")
-    with InterProcessLock(f"{current_app.storage_path}/storage/index/whoosh.lock"):
-        search_results = Whoosh().search(search_query, path=f'{data.get("folderId")}')
-        search_results = [result["id"] for result in search_results]
+    search_results = Whoosh().search(search_query, path=f'{data.get("folderId")}')
+    search_results = [result["id"] for result in search_results]
     socketio.emit(
         "search_results",
         {
@@ -285,8 +263,7 @@ def add_tag(data):
     """
     file_id = data.get("fileId")
     tag = data.get("tag")
-    with InterProcessLock(f"{current_app.storage_path}/storage/index/whoosh.lock"):
-        Whoosh().add_tag(file_id, tag)
+    Whoosh().add_tag(file_id, tag)
     socketio.emit(
         "tag_added",
         {"fileId": file_id, "tag": tag},
@@ -4,20 +4,19 @@ Module for handling login routes.
 
 from flask import render_template, redirect, url_for, flash, current_app
 from flask_login import login_user, current_user
-from flask_bcrypt import check_password_hash, generate_password_hash
 from app.login import bp
 from app.models.utilisateur import UTILISATEUR
 from app.models.notification import NOTIFICATION
 from app.forms.login_form import LoginForm
 from app.forms.forgotten_password_form import ForgottenPasswordForm
-from app.extensions import login_manager, db
+from app.extensions import login_manager, db, redis
 from datetime import datetime
 from flask import jsonify, request
 import secrets
 import string
 from app.mail import send_forgotten_password_email
+from app.utils import check_password, hash_password, password_needs_rehash, get_user, invalidate_user
 import uuid
-import json
 from itsdangerous import URLSafeTimedSerializer
 
 
@@ -32,7 +31,7 @@ def load_user(user):
     Returns:
         UTILISATEUR: The user object corresponding to the given ID.
     """
-    return UTILISATEUR.query.get(user)
+    return get_user(user)
 
 
 @bp.route("/", methods=["GET", "POST"])
@@ -54,40 +53,29 @@ def login():
         return redirect(url_for("home.home"))
     form = LoginForm()
     mdp_form = ForgottenPasswordForm()
-    if form.validate_on_submit():
-        user = UTILISATEUR.query.filter_by(email_Utilisateur=form.email.data).first()
-        if user:
-            if user.est_Actif_Utilisateur != 1:
-                if user.id_Role:
-                    flash("Votre compte est désactivé.", "info")
-                else:
-                    flash("Votre compte n'est pas encore activé.", "danger")
-                form.email.data = form.email.data
-                return render_template("login/index.html", form=form, mdp_form=mdp_form, title="Connexion")
-            if check_password_hash(user.mdp_Utilisateur, form.password.data):
+    is_login = form.validate_on_submit()
+    if is_login or mdp_form.validate_on_submit():
+        email = form.email.data if is_login else mdp_form.email.data
+        user = UTILISATEUR.query.filter_by(email_Utilisateur=email).first()
+        if not user:
+            flash("Adresse email inconnu.", "danger")
+        elif user.est_Actif_Utilisateur != 1:
+            if user.id_Role:
+                flash("Votre compte est désactivé.", "info")
+            else:
+                flash("Votre compte n'est pas encore activé.", "danger")
+        elif is_login:
+            if check_password(user.mdp_Utilisateur, form.password.data):
+                if password_needs_rehash(user.mdp_Utilisateur):
+                    user.mdp_Utilisateur = hash_password(form.password.data)
+                    db.session.commit()
+                    invalidate_user(user.id_Utilisateur)
                 login_user(user)
                 return redirect(url_for("home.home"))
             flash("Mot de passe incorrect.", "danger")
-            form.email.data = form.email.data
-            return render_template("login/index.html", form=form, mdp_form=mdp_form, title="Connexion")
-        flash("Adresse email inconnu.", "danger")
-        form.email.data = form.email.data
-        return render_template("login/index.html", form=form, mdp_form=mdp_form, title="Connexion")
-    if mdp_form.validate_on_submit():
-        user = UTILISATEUR.query.filter_by(
-            email_Utilisateur=mdp_form.email.data
-        ).first()
-        if user:
-            if user.est_Actif_Utilisateur != 1:
-                if user.id_Role:
-                    flash("Votre compte est désactivé.", "info")
-                else:
-                    flash("Votre compte n'est pas encore activé.", "danger")
-            else:
-                response = forgot_password(user.email_Utilisateur)
-                flash(response[0], response[1])
         else:
-            flash("Adresse email inconnu.", "danger")
+            response = forgot_password(user)
+            flash(response[0], response[1])
     return render_template("login/index.html", form=form, mdp_form=mdp_form, title="Connexion")
 
 
@@ -131,29 +119,26 @@ def hash_uuid(uuid):
     serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
     return serializer.dumps(str(uuid))
 
-def forgot_password(email):
+def forgot_password(user):
     """
-    Sends a forgotten password email to the user with the specified email address.
+    Sends a forgotten password email to the given user.
     Args:
-        email (str): The email address of the user.
+        user (UTILISATEUR): The user who forgot their password.
 
     Returns:
         list: A list containing a message and a status indicating the result of the operation.
     """
-    user = UTILISATEUR.query.filter_by(email_Utilisateur=email).first()
     uuid4 = uuid.uuid4()
-
-    json_file_path = f"{current_app.storage_path}/storage/password/password.json"
-    with open(json_file_path, "r") as json_file:
-        data = json.load(json_file)
-
-    for key, value in data.items():
-        if value["user_id"] == str(user.id_Utilisateur):
-            del data[key]
-            break
-    data[str(uuid4)] = {"user_id": str(user.id_Utilisateur), "date": str(datetime.now())}
-    with open(json_file_path, "w") as json_file:
-        json.dump(data, json_file)
+    user_id = str(user.id_Utilisateur)
+
+    old_uuid = redis.hget("pwreset:by_user", user_id)
+    with redis.pipeline() as pipeline:
+        if old_uuid is not None:
+            pipeline.delete(f"pwreset:uuid:{old_uuid.decode('utf-8')}")
+        pipeline.hset("pwreset:by_user", user_id, str(uuid4))
+        pipeline.hset(f"pwreset:uuid:{uuid4}", mapping={"user_id": user_id, "date": str(datetime.now())})
+        pipeline.expire(f"pwreset:uuid:{uuid4}", 3600)
+        pipeline.execute()
 
     try:
         send_forgotten_password_email(user.email_Utilisateur, hash_uuid(uuid4))
@@ -18,7 +18,7 @@ from app.models.notification import NOTIFICATION
 from app.models.utilisateur import UTILISATEUR
 from app.models.role import ROLE
 from app.models.fichier import FICHIER
-from app.utils import check_notitications
+from app.utils import check_notitications, invalidate_user
 from app.extensions import socketio, db
 from datetime import datetime
 
@@ -72,6 +72,7 @@ def handle_acceptance(notification, send_email_function, success_message):
     try:
         send_email_function(user.email_Utilisateur)
         db.session.commit()
+        invalidate_user(user.id_Utilisateur)
     except (SMTPException, ConnectionError, TimeoutError):
         db.session.rollback()
         return jsonify(
@@ -100,6 +101,7 @@ def handle_rejection(notification, send_email_function, success_message):
         if str(notification.type_Notification) == "1":
             db.session.delete(user)
         db.session.commit()
+        invalidate_user(user.id_Utilisateur)
     except (SMTPException, ConnectionError, TimeoutError):
         db.session.rollback()
         return jsonify(
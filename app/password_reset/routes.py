@@ -1,13 +1,12 @@
-from app.extensions import db
+from app.extensions import db, redis
 from app.password_reset import bp
 from app.models.utilisateur import UTILISATEUR
 from flask import current_app, flash, render_template
-import json
 import uuid
 from itsdangerous import URLSafeTimedSerializer
 from app.forms.password_reset_form import PasswordResetForm
 from datetime import datetime, timedelta
-from flask_bcrypt import generate_password_hash
+from app.utils import hash_password, invalidate_user
 from app.mail import send_reset_password_confirmation
 
 
@@ -28,35 +27,36 @@ def reinitialisation(hash_user_uuid):
     """
     form = PasswordResetForm()
     if form.validate_on_submit():
-        json_file_path = f"{current_app.storage_path}/storage/password/password.json"
-        with open(json_file_path, "r") as json_file:
-            data = json.load(json_file)
-            user_uuid = dehash_uuid(hash_user_uuid)
-            if str(user_uuid) in data:
-                user = UTILISATEUR.query.filter_by(id_Utilisateur=uuid.UUID(data[str(user_uuid)]["user_id"])).first()
-                date_str = data[str(user_uuid)]["date"]
-                date_obj = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S.%f") 
-                now = datetime.now()
-                # check if the request is still valid
-                if now - date_obj > timedelta(minutes=10):
-                    flash("La demande de réinitialisation n'est plus valide.", "danger")
-                # The request is still valid
-                else :
-                    password = form.password.data
-                    user.mdp_Utilisateur = generate_password_hash(password)
-                    try:
-                        send_reset_password_confirmation(user.email_Utilisateur)
-                        flash("Votre mot de passe a bien été réinitialisé.", "success")
-                        db.session.commit()
-                    except:
-                        flash("Erreur lors de l'envoi de l'email.", "danger")
-                        db.session.rollback()
-                del data[str(user_uuid)]
-                with open(json_file_path, "w") as json_file:
-                    json.dump(data, json_file)
-            # The user is not found
-            else:
-                flash("aucun utilisateur trouvé", "danger")
+        user_uuid = dehash_uuid(hash_user_uuid)
+        reset_request = redis.hgetall(f"pwreset:uuid:{user_uuid}")
+        if reset_request:
+            user_id = reset_request[b"user_id"].decode("utf-8")
+            user = UTILISATEUR.query.filter_by(id_Utilisateur=uuid.UUID(user_id)).first()
+            date_str = reset_request[b"date"].decode("utf-8")
+            date_obj = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S.%f") 
+            now = datetime.now()
+            # check if the request is still valid
+            if now - date_obj > timedelta(minutes=10):
+                flash("La demande de réinitialisation n'est plus valide.", "danger")
+            # The request is still valid
+            else :
+                password = form.password.data
+                user.mdp_Utilisateur = hash_password(password)
+                try:
+                    send_reset_password_confirmation(user.email_Utilisateur)
+                    flash("Votre mot de passe a bien été réinitialisé.", "success")
+                    db.session.commit()
+                    invalidate_user(user.id_Utilisateur)
+                except:
+                    flash("Erreur lors de l'envoi de l'email.", "danger")
+                    db.session.rollback()
+            with redis.pipeline() as pipeline:
+                pipeline.delete(f"pwreset:uuid:{user_uuid}")
+                pipeline.hdel("pwreset:by_user", user_id)
+                pipeline.execute()
+        # The user is not found
+        else:
+            flash("aucun utilisateur trouvé", "danger")
     return render_template("password_reset/index.html", form=form, is_authenticated=False, hash_user_uuid=hash_user_uuid)
 
 
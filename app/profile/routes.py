@@ -6,9 +6,8 @@ from flask_login import login_required, current_user, logout_user
 from app.profile import bp
 from app.extensions import db
 from app.forms.edit_profil_form import EditProfileForm
-from flask_bcrypt import check_password_hash, generate_password_hash
 from app.models.utilisateur import UTILISATEUR
-from app.utils import check_notitications
+from app.utils import check_notitications, check_password, hash_password, invalidate_user
 from app.models.role import ROLE
 from app.decorators import active_required
 
@@ -89,9 +88,12 @@ def verification():
         A JSON response containing the result of the password verification.
     """
     password = request.json.get("password")
-    return jsonify(
-        {"verif": check_password_hash(current_user.mdp_Utilisateur, password)}
+    password_hash = db.session.scalar(
+        db.select(UTILISATEUR.mdp_Utilisateur).where(
+            UTILISATEUR.id_Utilisateur == current_user.id_Utilisateur
+        )
     )
+    return jsonify({"verif": check_password(password_hash, password)})
 
 
 @bp.route("/deconnexion", methods=["POST"])
@@ -117,5 +119,6 @@ def edit_user(id, last_name, first_name, email, telephone, password):
     user.prenom_Utilisateur = first_name
     user.email_Utilisateur = email
     user.telephone_Utilisateur = telephone
-    user.mdp_Utilisateur = generate_password_hash(password)
+    user.mdp_Utilisateur = hash_password(password)
     db.session.commit()
+    invalidate_user(id)
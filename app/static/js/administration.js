@@ -82,14 +82,23 @@ document.addEventListener('DOMContentLoaded', function () {
     };
 
     // Functions
+    function createUploadFormData(data) {
+        let formData = new FormData();
+        formData.append('folderId', data.folderId);
+        formData.append('filename', data.filename);
+        formData.append('tags', data.tags);
+        formData.append('force', data.force ? 'true' : 'false');
+        formData.append('file', data.file);
+        return formData;
+    }
+
     async function handleUploadOverwriteDialog(data) {
         let response = await fetch('/administration/upload', {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json',
                 'X-CSRFToken': csrfToken
             },
-            body: JSON.stringify(data)
+            body: createUploadFormData(data)
         });
         let status = response.status;
         if (status === 200) {
@@ -169,89 +178,84 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     async function uploadFile(file, folderId, tags) {
-        return new Promise((resolve, reject) => {
-            let reader = new FileReader();
-            reader.onload = async function (ev) {
+        return new Promise(async (resolve, reject) => {
+            updateProgressBar();
+            let response = await fetch('/administration/upload', {
+                method: 'POST',
+                headers: {
+                    'X-CSRFToken': csrfToken
+                },
+                body: createUploadFormData({
+                    folderId: folderId,
+                    filename: file.name,
+                    file: file,
+                    tags: tags
+                })
+            });
+            let status = response.status;
+            let data = await response.json()
+            if (status === 200) {
+                fileUploadTotal++;
                 updateProgressBar();
-                let response = await fetch('/administration/upload', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': csrfToken
+                updateFolderFileCount(folderId);
+                createFileElement(data);
+                resolve();
+            }
+            else if (status === 409) {
+                dialogQueue.push({
+                    type: DIALOG_TYPES.UPLOAD_OVERWRITE,
+                    dialogOptions: {
+                        title: 'Fichier existant.',
+                        text: `Un fichier nommé "${data.filename}" existe déjà dans le classeur ${data.existingFolder}. Ce fichier a été créé par ${data.existingFileAuthorFirstName} ${data.existingFileAuthorLastName} le ${data.existingFileDate}. Voulez-vous remplacer ce fichier et le placer dans le classeur ${data.attemptedFolder} ?`,
+                        icon: 'warning',
+                        showCancelButton: true,
+                        confirmButtonText: 'Oui',
+                        cancelButtonText: 'Non',
+                        allowOutsideClick: false,
+                        allowEscapeKey: false
                     },
-                    body: JSON.stringify({
+                    data: {
                         folderId: folderId,
                         filename: file.name,
-                        data: ev.target.result,
-                        tags: tags
-                    })
+                        file: file,
+                        tags: tags,
+                        force: true
+                    }
                 });
-                let status = response.status;
-                let data = await response.json()
-                if (status === 200) {
-                    fileUploadTotal++;
-                    updateProgressBar();
-                    updateFolderFileCount(folderId);
-                    createFileElement(data);
-                    resolve();
-                }
-                else if (status === 409) {
-                    dialogQueue.push({
-                        type: DIALOG_TYPES.UPLOAD_OVERWRITE,
-                        dialogOptions: {
-                            title: 'Fichier existant.',
-                            text: `Un fichier nommé "${data.filename}" existe déjà dans le classeur ${data.existingFolder}. Ce fichier a été créé par ${data.existingFileAuthorFirstName} ${data.existingFileAuthorLastName} le ${data.existingFileDate}. Voulez-vous remplacer ce fichier et le placer dans le classeur ${data.attemptedFolder} ?`,
-                            icon: 'warning',
-                            showCancelButton: true,
-                            confirmButtonText: 'Oui',
-                            cancelButtonText: 'Non',
-                            allowOutsideClick: false,
-                            allowEscapeKey: false
-                        },
-                        data: {
-                            folderId: folderId,
-                            filename: file.name,
-                            data: ev.target.result,
-                            tags: tags,
-                            force: true
-                        }
-                    });
-                    showNextDialog();
-                    resolve();
-                }
-                else if (status === 422) {
-                    dialogQueue.push({
-                        type: DIALOG_TYPES.UPLOAD_OVERWRITE_UNPROCESSABLE,
-                        dialogOptions: {
-                            title: 'Fichier non traité.',
-                            text: `Le fichier "${data.filename}" existe déjà dans le classeur ${data.existingFolder}. Ce fichier a été créé par ${data.existingFileAuthorFirstName} ${data.existingFileAuthorLastName} le ${data.existingFileDate}. Ce fichier n'a pas encore été traité. Veuillez attendre que le fichier soit traité avant de le remplacer.`,
-                            icon: 'error',
-                            showCloseButton: true,
-                            showConfirmButton: false,
-                            allowEscapeKey: false,
-                            allowOutsideClick: false
-                        }
-                    });
-                    showNextDialog();
-                    resolve();
-                }
-                else if (status === 404) {
-                    dialogQueue.push({
-                        type: DIALOG_TYPES.ALERT,
-                        dialogOptions: {
-                            title: 'Erreur.',
-                            text: data.error,
-                            icon: 'error',
-                            showConfirmButton: false,
-                            timer: 2500,
-                            backdrop: false
-                        }
-                    });
-                    showNextDialog();
-                    resolve();
-                }
-            };
-            reader.readAsDataURL(file);
+                showNextDialog();
+                resolve();
+            }
+            else if (status === 422) {
+                dialogQueue.push({
+                    type: DIALOG_TYPES.UPLOAD_OVERWRITE_UNPROCESSABLE,
+                    dialogOptions: {
+                        title: 'Fichier non traité.',
+                        text: `Le fichier "${data.filename}" existe déjà dans le classeur ${data.existingFolder}. Ce fichier a été créé par ${data.existingFileAuthorFirstName} ${data.existingFileAuthorLastName} le ${data.existingFileDate}. Ce fichier n'a pas encore été traité. Veuillez attendre que le fichier soit traité avant de le remplacer.`,
+                        icon: 'error',
+                        showCloseButton: true,
+                        showConfirmButton: false,
+                        allowEscapeKey: false,
+                        allowOutsideClick: false
+                    }
+                });
+                showNextDialog();
+                resolve();
+            }
+            else if (status === 404) {
+                dialogQueue.push({
+                    type: DIALOG_TYPES.ALERT,
+                    dialogOptions: {
+                        title: 'Erreur.',
+                        text: data.error,
+                        icon: 'error',
+                        showConfirmButton: false,
+                        timer: 2500,
+                        backdrop: false
+                    }
+                });
+                showNextDialog();
+                resolve();
+            }
         });
     }
 
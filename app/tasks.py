@@ -1,5 +1,5 @@
 import os
-import json
+import orjson
 from datetime import datetime
 from app.extensions import celery, redis, db
 from app import create_app
@@ -18,8 +18,8 @@ def process_file(file_path, filename, folder_id, file_id, user_tags, current_use
                 next_file = redis.lindex('files_queue', 1).decode('utf-8')
             else:
                 next_file = None
-            redis.publish('worker_status', json.dumps({'worker': worker_name, 'status': 'processing', 'file': filename, 'next_file': next_file}))
-            redis.set(f'worker:{worker_name}', json.dumps({'worker': worker_name, 'status': 'processing', 'file': filename, 'next_file': next_file}))
+            redis.publish('worker_status', orjson.dumps({'worker': worker_name, 'status': 'processing', 'file': filename, 'next_file': next_file}))
+            redis.set(f'worker:{worker_name}', orjson.dumps({'worker': worker_name, 'status': 'processing', 'file': filename, 'next_file': next_file}))
             file_text = FileReader().read(file_path, filename.split(".")[-1])
             file_tags = f'{' '.join(NLPProcessor().tokenize(file_text))} {user_tags}'
             with InterProcessLock(f'{app.storage_path}/storage/index/whoosh.lock'):
@@ -30,18 +30,17 @@ def process_file(file_path, filename, folder_id, file_id, user_tags, current_use
             FileReader().screenshot(file_path, filename.split(".")[-1], folder_id, file_id)
             date_str = file['date_Fichier'].split(':')[0] + ':' + file['date_Fichier'].split(':')[1]
             file['date_Fichier'] = datetime.strptime(date_str, '%d/%m/%Y %H:%M').strftime('%d/%m/%Y %H:%M')
-            redis.publish('file_processed', json.dumps({'filename': filename, 'folder_id': folder_id, 'file_id': file_id, 'user': current_user, 'file': file, 'folder': folder, 'action': action}))
+            redis.publish('file_processed', orjson.dumps({'filename': filename, 'folder_id': folder_id, 'file_id': file_id, 'user': current_user, 'file': file, 'folder': folder, 'action': action}))
         except Exception as _:
-            with InterProcessLock(f'{app.storage_path}/storage/index/whoosh.lock'):
-                Whoosh().delete_document(file_id)
+            Whoosh().delete_document(file_id)
             database_file = FICHIER.query.get(file_id)
             db.session.delete(database_file)
             db.session.commit()
             os.remove(file_path)
         finally:
             redis.lpop('files_queue')
-            redis.publish('worker_status', json.dumps({'worker': worker_name, 'status': 'idle', 'file': None, 'next_file': None}))
-            redis.publish('process_status', json.dumps({}))
+            redis.publish('worker_status', orjson.dumps({'worker': worker_name, 'status': 'idle', 'file': None, 'next_file': None}))
+            redis.publish('process_status', orjson.dumps({}))
             redis.delete(f'worker:{worker_name}')
 
 @celery.task(name='app.tasks.verify_index')
@@ -51,12 +50,9 @@ def verify_index(current_user_dict):
         with InterProcessLock(f"{app.storage_path}/storage/index/whoosh.lock"):
             whoosh_documents = Whoosh().get_all_documents()
         database_documents = FICHIER.query.all()
-        for whoosh_document in whoosh_documents:
-            if str(whoosh_document["id"]) not in [
-                str(database_document.id_Fichier)
-                for database_document in database_documents
-            ]:
-                Whoosh().delete_document(whoosh_document["id"])
+        database_ids = {str(database_document.id_Fichier) for database_document in database_documents}
+        orphan_ids = [whoosh_document["id"] for whoosh_document in whoosh_documents if str(whoosh_document["id"]) not in database_ids]
+        missing_documents = []
         for database_document in database_documents:
             file_path = os.path.join(
                 app.storage_path,
@@ -88,9 +84,13 @@ def verify_index(current_user_dict):
                             ]
                         )
             else:
-                with InterProcessLock(f"{app.storage_path}/storage/index/whoosh.lock"):
-                    Whoosh().delete_document(str(database_document.id_Fichier))
-                db.session.delete(database_document)
-                db.session.commit()
-        redis.publish('index_verification_success', json.dumps({'message': 'La vérification de l\'index a été effectuée avec succès.',
+                missing_documents.append(database_document)
+        orphan_ids.extend(str(database_document.id_Fichier) for database_document in missing_documents)
+        if orphan_ids:
+            Whoosh().delete_documents(orphan_ids)
+        Whoosh().optimize()
+        for database_document in missing_documents:
+            db.session.delete(database_document)
+        db.session.commit()
+        redis.publish('index_verification_success', orjson.dumps({'message': 'La vérification de l\'index a été effectuée avec succès.',
                                                                 'user': current_user_dict['id_Utilisateur']}))
\ No newline at end of file
@@ -1,40 +1,69 @@
 import os
 import re
 import uuid
+import orjson
 import zipfile
 import shutil
-from collections import Counter
-from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
+from threading import Lock, Thread
 from PIL import Image, UnidentifiedImageError
 from chardet import detect
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from docx import Document
+from fasteners import InterProcessLock
 from flask import current_app
+from flask_bcrypt import check_password_hash
 from flask_login import current_user
+from gevent import get_hub
+from gevent.monkey import is_module_patched
 from pandas import read_excel, read_csv
-from pdf2image import convert_from_path
 from pptx import Presentation
 from spacy import load
 from spacy.lang.en.stop_words import STOP_WORDS as en_stop
 from spacy.lang.fr.stop_words import STOP_WORDS as fr_stop
-from spacy.util import compile_infix_regex
 from unidecode import unidecode
 from whoosh.analysis import StandardAnalyzer, KeywordAnalyzer
 from whoosh.fields import Schema, TEXT, STORED, KEYWORD, ID
 from whoosh.index import create_in, open_dir
 from whoosh.query import *
+from whoosh.writing import MERGE_SMALL
 from xlrd import open_workbook
 import fitz
 import pytesseract
 from odf import text as odf_text, teletype
 from odf.opendocument import load as load_odf
-from app.extensions import db
+from app.decorators import request_cached
+from app.extensions import db, redis
+from app.models.a_acces import A_ACCES
 from app.models.dossier import DOSSIER
 from app.models.favoris import FAVORIS
 from app.models.fichier import FICHIER
 from app.models.notification import NOTIFICATION
+from app.models.sous_dossier import SOUS_DOSSIER
+from app.models.utilisateur import UTILISATEUR
+from sqlalchemy.orm import make_transient_to_detached
 from wtforms import ValidationError
 
+# An operator followed by another operator or by the end of the query, checked with a
+# lookahead so that a single pass also handles runs of operators.
+_OPERATOR_REGEX = re.compile(r'([&|])(?=\s*(?:[&|]|$))')
+# Newlines, tabs, form feeds and the other control characters left by the PDF text layer.
+_CONTROL_CHARACTERS_REGEX = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+# Any character other than whitespace, control or format characters and private-use glyphs.
+# A PDF text layer without one is unreadable and goes through OCR instead.
+_VISIBLE_CHARACTER_REGEX = re.compile(r'[^\s\x00-\x1f\x7f-\x9f\u200b-\u200f\u202a-\u202e\u2060-\u206f\ufeff\ue000-\uf8ff]')
+# Commits add a segment without merging until the index reaches this many segments, then merge the small ones.
+_MAX_INDEX_SEGMENTS = 16
+password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=2)
+_folder_trees = {}
+_folder_trees_lock = Lock()
+
+
 class SingletonMeta(type):
     """Singleton metaclass.
 
@@ -48,11 +77,15 @@ class SingletonMeta(type):
     _lock = Lock()
     
     def __call__(cls, *args, **kwargs):
+        instance = cls._instances.get(cls)
+        if instance is not None:
+            return instance
         with cls._lock:
-            if cls not in cls._instances:
+            instance = cls._instances.get(cls)
+            if instance is None:
                 instance = super().__call__(*args, **kwargs)
                 cls._instances[cls] = instance
-        return cls._instances[cls]
+        return instance
 
 
 class Whoosh(metaclass=SingletonMeta):
@@ -61,11 +94,14 @@ class Whoosh(metaclass=SingletonMeta):
 
     Attributes:
         open_index (IndexReader): The open index reader for performing search operations.
+        lock_path (str): The path of the inter-process lock guarding the index writer.
 
     Methods:
+        searcher: Get the shared searcher, refreshed when the index changed.
         add_document: Add a document to the search index.
         delete_document: Delete a document from the search index.
         delete_documents: Delete multiple documents from the search index.
+        optimize: Merge the segments of the search index.
         get_all_documents: Get all documents from the search index.
         document_exists: Check if a document with the given ID exists in the search index.
         search: Perform a search query on the search index.
@@ -80,8 +116,140 @@ class Whoosh(metaclass=SingletonMeta):
                 os.mkdir(f'{current_app.storage_path}/storage/index')
                 create_in(f'{current_app.storage_path}/storage/index', schema)
             self.open_index = open_dir(f'{current_app.storage_path}/storage/index')
+            self.lock_path = f'{current_app.storage_path}/storage/index/whoosh.lock'
+        self._searcher = None
+        self._searcher_lock = Lock()
+        self._write_queue = Queue()
+        Thread(target=self._write_loop, daemon=True).start()
+
+    def searcher(self):
+        """
+        Get the searcher shared by the whole process.
+
+        The searcher is only reopened when a new generation of the index has been committed.
+
+        Returns:
+            Searcher: The up to date searcher.
+
+        """
+        with self._searcher_lock:
+            if self._searcher is None:
+                self._searcher = self.open_index.searcher()
+            else:
+                self._searcher = self._searcher.refresh()
+            return self._searcher
 
-    def add_document(self, title, content, path, tags, id):
+    def _write(self, job, ids=(), optimize=False):
+        """
+        Submit a write job to the writer thread and wait for its result.
+
+        Args:
+            job (callable): A function taking the writer.
+            ids (iterable, optional): The IDs of the documents the job writes. Defaults to none.
+            optimize (bool, optional): Whether the batch commit merges every segment. Defaults to False.
+
+        Returns:
+            The result of the job.
+
+        """
+        future = Future()
+        self._write_queue.put((job, future, frozenset(ids), optimize))
+        return future.result()
+
+    def _write_loop(self):
+        """
+        Drain the write queue, applying the pending jobs with as few writers and commits as possible.
+
+        A writer can neither replace nor delete a document it added itself, so the batch is committed
+        before any job writing a document already written by the current writer.
+        """
+        while True:
+            jobs = [self._write_queue.get()]
+            while len(jobs) < 100:
+                try:
+                    jobs.append(self._write_queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                with InterProcessLock(self.lock_path):
+                    writer = self.open_index.writer()
+                    try:
+                        written_ids = set()
+                        results = []
+                        for job, future, ids, _ in jobs:
+                            if not written_ids.isdisjoint(ids):
+                                self._commit(writer)
+                                self._set_results(results)
+                                writer = self.open_index.writer()
+                                written_ids = set()
+                                results = []
+                            written_ids |= ids
+                            try:
+                                results.append((future, job(writer), None))
+                            except Exception as e:
+                                results.append((future, None, e))
+                        self._commit(writer, optimize=any(optimize for _, _, _, optimize in jobs))
+                    except BaseException:
+                        if not writer.is_closed:
+                            writer.cancel()
+                        raise
+            except Exception as e:
+                for _, future, _, _ in jobs:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self._set_results(results)
+
+    def _set_results(self, results):
+        """
+        Hand the results of committed jobs to their waiting callers.
+
+        Args:
+            results (list): The (future, result, exception) triples of the jobs.
+
+        """
+        for future, result, exception in results:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    @contextmanager
+    def bulk(self):
+        """
+        Open a single writer for many operations, committed once on exit.
+
+        The writer is cancelled if the block raises. Callers hold the index lock.
+
+        Yields:
+            IndexWriter: The writer to pass to the document methods.
+
+        """
+        writer = self.open_index.writer()
+        try:
+            yield writer
+        except BaseException:
+            writer.cancel()
+            raise
+        self._commit(writer)
+
+    def _commit(self, writer, optimize=False):
+        """
+        Commit a writer without merging segments, or merge the small ones once the index has too many.
+
+        Args:
+            writer (IndexWriter): The writer to commit.
+            optimize (bool, optional): Whether to merge every segment. Defaults to False.
+
+        """
+        if optimize:
+            writer.commit(optimize=True)
+        elif len(list(self.searcher().reader().leaf_readers())) >= _MAX_INDEX_SEGMENTS:
+            writer.commit(mergetype=MERGE_SMALL)
+        else:
+            writer.commit(merge=False)
+
+    def add_document(self, title, content, path, tags, id, writer=None):
         """
         Add a document to the search index.
 
@@ -91,15 +259,16 @@ class Whoosh(metaclass=SingletonMeta):
             path (str): The path of the document.
             tags (str): The tags associated with the document.
             id (str): The ID of the document.
+            writer (IndexWriter, optional): A writer opened by bulk. Defaults to None, which commits the document at once.
 
         """
-        writer = self.open_index.writer()
-        try:
+        if writer is not None:
+            writer.add_document(title=title, content=content, path=path, tags=tags, id=id)
+            return
+        with self.bulk() as writer:
             writer.add_document(title=title, content=content, path=path, tags=tags, id=id)
-        finally:
-            writer.commit()
 
-    def update_document(self, title, content, path, tags, id):
+    def update_document(self, title, content, path, tags, id, writer=None):
         """
         Update a document in the search index.
 
@@ -109,13 +278,14 @@ class Whoosh(metaclass=SingletonMeta):
             path (str): The path of the document.
             tags (str): The tags associated with the document.
             id (str): The ID of the document.
+            writer (IndexWriter, optional): A writer opened by bulk. Defaults to None, which commits the document at once.
 
         """
-        writer = self.open_index.writer()
-        try:
+        if writer is not None:
+            writer.update_document(title=title, content=content, path=path, tags=tags, id=id)
+            return
+        with self.bulk() as writer:
             writer.update_document(title=title, content=content, path=path, tags=tags, id=id)
-        finally:
-            writer.commit()
 
     def add_tag(self, id, tag):
         """
@@ -126,17 +296,15 @@ class Whoosh(metaclass=SingletonMeta):
             tag (str): The tag to add.
 
         """
-        writer = self.open_index.writer()
-        try:
+        def job(writer):
             document = self.get_document(id)
             tags = document["tags"].split(" ")
             for new_tag in tag.split(";"):
                 if new_tag not in tags:
                     tags.append(new_tag)
-            new_tags = " ".join(tags)
-            writer.update_document(title=document["title"], content=document["content"], path=document["path"], tags=new_tags, id=id)
-        finally:
-            writer.commit()
+            writer.update_document(title=document["title"], content=document["content"], path=document["path"], tags=" ".join(tags), id=id)
+
+        self._write(job, ids=[id])
 
     def transfer_documents(self, files, folder):
         """
@@ -146,27 +314,29 @@ class Whoosh(metaclass=SingletonMeta):
             documents (list): A list of documents to update.
 
         """
-        writer = self.open_index.writer()
-        try:
+        searcher = self.searcher()
+        with self.bulk() as writer:
             for id in files:
-                document = self.get_document(id)
-                writer.update_document(title=document['title'], content=document['content'], path=folder, tags=document['tags'], id=id)
-        finally:
-            writer.commit()
+                document = searcher.document(id=id)
+                self.update_document(document['title'], document['content'], folder, document['tags'], id, writer=writer)
 
-    def delete_document(self, id):
+    def delete_document(self, id, writer=None):
         """
         Delete a document from the search index.
 
         Args:
             id (str): The ID of the document to delete.
+            writer (IndexWriter, optional): A writer opened by bulk. Defaults to None, which queues the deletion on the writer thread.
 
         """
-        writer = self.open_index.writer()
-        try:
+        if writer is not None:
             writer.delete_by_term("id", id)
-        finally:
-            writer.commit()
+            return
+
+        def job(writer):
+            writer.delete_by_term("id", id)
+
+        self._write(job, ids=[id])
 
     def delete_documents(self, ids):
         """
@@ -176,12 +346,20 @@ class Whoosh(metaclass=SingletonMeta):
             ids (list): A list of IDs of the documents to delete.
 
         """
-        writer = self.open_index.writer()
-        try:
+        def job(writer):
             for id in ids:
                 writer.delete_by_term("id", id)
-        finally:
-            writer.commit()
+
+        self._write(job, ids=ids)
+
+    def optimize(self):
+        """
+        Merge all the segments of the search index into one.
+
+        Commits only merge the small segments once the index has too many of them, this compacts it fully.
+
+        """
+        self._write(lambda writer: None, optimize=True)
 
     def get_all_documents(self):
         """
@@ -191,11 +369,7 @@ class Whoosh(metaclass=SingletonMeta):
             list: A list of documents in the search index.
 
         """
-        documents = []
-        with self.open_index.searcher() as searcher:
-            for doc in searcher.documents():
-                documents.append(doc)
-        return documents
+        return list(self.searcher().documents())
     
     def get_document(self, id):
         """
@@ -208,8 +382,7 @@ class Whoosh(metaclass=SingletonMeta):
             dict: The document in the search index.
 
         """
-        with self.open_index.searcher() as searcher:
-            return searcher.document(id=id)
+        return self.searcher().document(id=id)
     
     def document_exists(self, id):
         """
@@ -222,8 +395,7 @@ class Whoosh(metaclass=SingletonMeta):
             bool: True if the document exists, False otherwise.
 
         """
-        with self.open_index.searcher() as searcher:
-            return searcher.document(id=id) is not None
+        return self.searcher().document_number(id=id) is not None
 
     def search(self, query, path=None):
         """
@@ -244,8 +416,7 @@ class Whoosh(metaclass=SingletonMeta):
             query = unidecode(query).lower()
             if query.startswith("&") or query.startswith("|"):
                 query = "* " + query
-            while re.search(r'([&|])\s*([&|]|$)', query):
-                query = re.sub(r'([&|])\s*([&|]|$)', r'\1 * \2', query)
+            query = _OPERATOR_REGEX.sub(r'\1 * ', query)
             or_conditions = [cond.strip() for cond in query.split("|")]
             conditions = [[cond.strip() for cond in condition.split('&')] for condition in or_conditions]
             if path is not None:
@@ -253,79 +424,69 @@ class Whoosh(metaclass=SingletonMeta):
                 subquery = And([Term("path", path), Or([And([Or([Phrase("content", condition.split()), Term("tags", condition), Wildcard("title", "*"+condition.replace(" ", "_")+"*")]) for condition in condition_list]) for condition_list in conditions])])
             else:
                 subquery = Or([And([Or([Phrase("content", condition.split()), Term("tags", condition), Wildcard("title", "*"+condition.replace(" ", "_")+"*")]) for condition in condition_list]) for condition_list in conditions])
-        favoris = db.session.query(FAVORIS.c.id_Fichier).filter(FAVORIS.c.id_Utilisateur == current_user.id_Utilisateur).all()
-        favoris_ids = [favori.id_Fichier for favori in favoris]
-        with self.open_index.searcher() as searcher:
-            results = searcher.search(subquery, limit=None)
-            results_list = []
-            for result in results:
-                result_field = result.fields()
-                result_field['extension'] = result_field['title'].split('.')[-1]
-                if int(result_field['id']) in favoris_ids:
-                    result_field['favori'] = True
-                else :
-                    result_field['favori'] = False
-                results_list.append(result_field)
+        favoris_ids = get_favorite_ids(current_user.id_Utilisateur)
+        results = self.searcher().search(subquery, limit=None)
+        results_list = []
+        for result in results:
+            result_field = result.fields()
+            result_field['extension'] = result_field['title'].split('.')[-1]
+            result_field['favori'] = int(result_field['id']) in favoris_ids
+            results_list.append(result_field)
         return results_list
 
 
+@lru_cache(maxsize=65536)
+def normalize_word(word):
+    """Lowercase a word and transliterate it to ASCII."""
+    return word.lower() if word.isascii() else unidecode(word).lower()
+
+
 class NLPProcessor(metaclass=SingletonMeta):
-    def __init__(self, batch_size=100000):
+    def __init__(self, batch_size=100000, n_process=1):
         self.batch_size = batch_size
-        self.tokenizer_nlp = load("fr_hades_model")
-        self.lemmatizer_nlp = load("fr_core_news_sm")
-        self.tokenizer_nlp.max_length = batch_size
+        self.n_process = n_process
+        self.lemmatizer_nlp = load("fr_core_news_sm", exclude=["parser", "ner", "senter"])
         self.lemmatizer_nlp.max_length = batch_size
-        default_infixes = list(self.tokenizer_nlp.Defaults.infixes)
-        default_infixes.append("[A-Z][a-z0-9]+")
-        infix_regex = compile_infix_regex(default_infixes)
-        self.tokenizer_nlp.tokenizer.infix_finditer = infix_regex.finditer
-        self.stop_words = set(fr_stop).union(en_stop)
-
-    def clean(self, text):
-        return [
-            unidecode(token.text).lower()
-            for token in self.tokenizer_nlp(text)
-            if unidecode(token.text).lower() not in self.stop_words
-            and len(token) >= 3
-            and not token.is_stop
-            and not token.is_punct
-            and not token.is_space
-            and not token.like_url
-            and not token.like_email
-            and not token.is_digit
-            and not token.is_currency
-        ]
-
-    def lemmatize(self, text):
-        batches = [
-            text[i : i + self.batch_size] for i in range(0, len(text), self.batch_size)
-        ]
-        result = []
-        with ThreadPoolExecutor() as executor:
-            for batch in executor.map(self.process_lemmatize_batch, batches):
-                result.append(" ".join(token.lemma_ for token in batch))
-        return " ".join(result)
-
-    def process_lemmatize_batch(self, batch):
-        return self.lemmatizer_nlp(batch)
-
-    def tokenize(self, text):
-        text = self.lemmatize(text)
-        batches = [
-            text[i : i + self.batch_size] for i in range(0, len(text), self.batch_size)
-        ]
-        word_frequencies = {}
-        with ThreadPoolExecutor() as executor:
-            for batch in executor.map(self.process_tokenize_batch, batches):
-                word_frequencies.update(batch)
-        word_frequencies = sorted(
-            word_frequencies.items(), key=lambda x: x[1], reverse=True
+        self.stop_words = frozenset(unidecode(word).lower() for word in fr_stop | en_stop)
+
+    def clean_tokens(self, doc):
+        for token in doc:
+            if token.is_space or token.is_punct:
+                continue
+            word = normalize_word(token.lemma_)
+            if len(word) < 3 or word in self.stop_words:
+                continue
+            lemma = doc.vocab[token.lemma_]
+            if lemma.is_stop or lemma.like_url or lemma.like_email or lemma.is_digit or lemma.is_currency:
+                continue
+            yield word
+
+    def split_text(self, text):
+        start = 0
+        while start < len(text):
+            end = start + self.batch_size
+            if end < len(text):
+                cut = text.rfind("\n", start, end)
+                if cut <= start:
+                    cut = text.rfind(" ", start, end)
+                if cut > start:
+                    end = cut
+            yield text[start:end]
+            start = end
+
+    def _lemma_tokens(self, text):
+        chunks = list(self.split_text(text))
+        docs = self.lemmatizer_nlp.pipe(
+            chunks,
+            batch_size=1,
+            n_process=max(1, min(self.n_process, len(chunks))),
         )
-        return [word for word, _ in word_frequencies]
+        for doc in docs:
+            yield from self.clean_tokens(doc)
 
-    def process_tokenize_batch(self, batch):
-        return Counter(self.clean(batch))
+    def tokenize(self, text):
+        word_frequencies = Counter(self._lemma_tokens(text))
+        return [word for word, _ in word_frequencies.most_common()]
 
 
 class FileReader(metaclass=SingletonMeta):
@@ -367,10 +528,7 @@ class FileReader(metaclass=SingletonMeta):
         return read_csv(file_path).to_string(index=False)
 
     def read_docx(self, file_path):
-        text = ""
-        for paragraph in Document(file_path).paragraphs:
-            text += paragraph.text
-        return text
+        return "".join(paragraph.text for paragraph in Document(file_path).paragraphs)
     
     def read_ocr(self, file_path):
         try:
@@ -380,56 +538,47 @@ class FileReader(metaclass=SingletonMeta):
 
     def read_pdf(self, file_path):
         file = fitz.open(file_path)
-        text = ""
-        for page in file:
-            text += page.get_text()
-            text.replace("\n", " ")
-        cleaned_text = ''.join([i for i in text if i.isprintable() and not i.isspace()])
-        if cleaned_text == "":
-            images = convert_from_path(file_path)
-            for image in images:
-                text += pytesseract.image_to_string(image, lang="fra")
+        text = _CONTROL_CHARACTERS_REGEX.sub(" ", "".join(page.get_text() for page in file))
+        if not _VISIBLE_CHARACTER_REGEX.search(text):
+            text = "".join(ocr_images(render_pdf_pages(file)))
         return text
 
     def read_txt(self, file_path):
-        with open(file_path, "r", encoding=detect(open(file_path, "rb").read())["encoding"]) as file:
+        with open(file_path, "rb") as file:
+            encoding = detect(file.read(65536))["encoding"] or "utf-8"
+        with open(file_path, "r", encoding=encoding, errors="replace") as file:
             return file.read()
 
     def read_xlsx(self, file_path):
-        df = read_excel(file_path, engine="openpyxl")
-        text = ''
-        for column in df.columns:
-            text += df[column].astype(str).str.cat(sep=' ') + ' '
-            text = text.replace('nan', '')
-        return text
+        try:
+            df = read_excel(file_path, engine="calamine", dtype=str, na_filter=False)
+        except Exception:
+            df = read_excel(file_path, engine="openpyxl", dtype=str, na_filter=False)
+        return " ".join(df.to_numpy().ravel().tolist())
 
     def read_xls(self, file_path):
         file = open_workbook(file_path)
-        text = ""
+        parts = []
         for sheet in file.sheets():
             for row in range(sheet.nrows):
-                for cell in sheet.row(row):
-                    text += str(cell.value) + " "
-        return text
+                parts.extend(map(str, sheet.row_values(row)))
+        return " ".join(parts)
 
     def read_pptx(self, file_path):
-        text = ""
+        parts = []
         for slide in Presentation(file_path).slides:
             for shape in slide.shapes:
                 if hasattr(shape, "text"):
-                    text += shape.text
-        return text
+                    parts.append(shape.text)
+        return "".join(parts)
     
     def read_html(self, file_path):
         with open(file_path, "r") as file:
             return file.read()
         
     def read_odt(self, file_path):
-        text = ""
         doc = load_odf(file_path)
-        for element in doc.getElementsByType(odf_text.P):
-            text += teletype.extractText(element)
-        return text
+        return "".join(teletype.extractText(element) for element in doc.getElementsByType(odf_text.P))
     
     def screenshot(self, file_path, extension, folder_id, file_id):
         extension = extension.lower()
@@ -454,20 +603,288 @@ class FileDownloader(metaclass=SingletonMeta):
             os.makedirs(f"{current_app.storage_path}/storage/downloads")
         zip_filename = f"{uuid.uuid4().hex}.zip"
         zip_path = f"{current_app.storage_path}/storage/downloads/{zip_filename}"
-        files = db.session.query(FICHIER).filter(FICHIER.id_Fichier.in_(file_ids)).all()
-        files_by_folder = {}
-        for file in files:
-            if file.DOSSIER_.id_Dossier not in files_by_folder:
-                files_by_folder[file.DOSSIER_.id_Dossier] = []
-            files_by_folder[file.DOSSIER_.id_Dossier].append(file)
-        with zipfile.ZipFile(zip_path, "w") as zip_file:
-            for folder_id in files_by_folder:
-                database_folder = db.session.query(DOSSIER).filter(DOSSIER.id_Dossier == folder_id).first()
-                for file in files_by_folder[folder_id]:
-                    file_path = os.path.join(current_app.storage_path, 'storage', 'files', str(folder_id), f'{file.id_Fichier}.{file.extension_Fichier}')
-                    zip_file.write(file_path, arcname=os.path.join(database_folder.nom_Dossier.replace('/', '-'), f'{file.nom_Fichier}'))
+        rows = (
+            db.session.query(FICHIER, DOSSIER)
+            .join(FICHIER.DOSSIER_)
+            .filter(FICHIER.id_Fichier.in_(file_ids))
+            .order_by(DOSSIER.id_Dossier)
+            .all()
+        )
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED, allowZip64=True) as zip_file:
+            for file, database_folder in rows:
+                file_path = os.path.join(current_app.storage_path, 'storage', 'files', str(database_folder.id_Dossier), f'{file.id_Fichier}.{file.extension_Fichier}')
+                info = zipfile.ZipInfo.from_file(file_path, arcname=os.path.join(database_folder.nom_Dossier.replace('/', '-'), f'{file.nom_Fichier}'))
+                with open(file_path, "rb") as source, zip_file.open(info, "w", force_zip64=True) as destination:
+                    shutil.copyfileobj(source, destination, 1 << 20)
         return zip_path
 
+def run_blocking_io(function, *args):
+    """
+    Run a blocking disk operation without blocking the other greenlets.
+
+    Under the gevent worker, the operation runs in a native thread of the hub's
+    threadpool while the current greenlet waits cooperatively for its result.
+
+    Args:
+        function (callable): The blocking function to run.
+        *args: The arguments passed to the function.
+
+    Returns:
+        The result of the function.
+    """
+    if is_module_patched("threading"):
+        return get_hub().threadpool.apply(function, args)
+    return function(*args)
+
+def ocr_images(images):
+    """
+    Extract the text of images with Tesseract, several images at a time.
+
+    Each image is read by its own tesseract process, limited to one thread, so a few threads
+    waiting on them are enough to use every core. Images are consumed as results come in,
+    so only a few of them are held in memory at once.
+
+    Args:
+        images (iterable): The PIL images to read, in order.
+
+    Returns:
+        list: The text recognized on each image, in the same order.
+    """
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    workers = os.cpu_count() or 1
+    texts = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for image in images:
+            pending.append(executor.submit(pytesseract.image_to_string, image, lang="fra"))
+            if len(pending) > workers:
+                texts.append(pending.popleft().result())
+        texts.extend(future.result() for future in pending)
+    return texts
+
+def render_pdf_pages(file):
+    """
+    Render the pages of an open PDF as images for OCR.
+
+    Args:
+        file (Document): The open PDF document.
+
+    Yields:
+        Image: Each page rendered at 200 dpi.
+    """
+    for page in file:
+        pixmap = page.get_pixmap(dpi=200)
+        yield Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+def get_folder_tree_version():
+    """Get the current version of the folder tree cache.
+
+    Returns:
+        int: The folder tree version, bumped on every folder mutation.
+    """
+    version = redis.get("folder_tree_version")
+    return int(version) if version is not None else 0
+
+def invalidate_folder_tree():
+    """Invalidate the cached folder trees of every role."""
+    redis.incr("folder_tree_version")
+
+def invalidates_folder_tree(f):
+    """
+    Decorator that invalidates the cached folder trees once the decorated function returns or raises.
+    Handlers committing folder changes in several steps thus never leave a partial change cached.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        finally:
+            invalidate_folder_tree()
+
+    return decorated_function
+
+def get_folder_tree_for_role(role_id):
+    """
+    Get the tree of the folders accessible by a role.
+
+    The tree is built with a single query and cached in Redis until the next folder mutation.
+    Each process also keeps the trees of the current version in memory.
+
+    Args:
+        role_id (int): The ID of the role.
+
+    Returns:
+        list: A list of dictionaries representing the root folders, including their name, color, id and subfolders.
+    """
+    version = get_folder_tree_version()
+    tree = _folder_trees.get((version, role_id))
+    if tree is not None:
+        return tree
+    key = f"folder_tree:{version}:{role_id}"
+    cached_tree = redis.get(key)
+    if cached_tree is not None:
+        tree = orjson.loads(cached_tree)
+    else:
+        tree = build_folder_tree(role_id)
+        redis.set(key, orjson.dumps(tree), ex=3600)
+    with _folder_trees_lock:
+        for stale_key in [k for k in _folder_trees if k[0] != version]:
+            del _folder_trees[stale_key]
+        _folder_trees[(version, role_id)] = tree
+    return tree
+
+def build_folder_tree(role_id):
+    """
+    Build the tree of the folders accessible by a role with a single query.
+
+    Args:
+        role_id (int): The ID of the role.
+
+    Returns:
+        list: A list of dictionaries representing the root folders, including their name, color, id, search index path and subfolders.
+    """
+    rows = (
+        db.session.query(
+            DOSSIER.id_Dossier,
+            DOSSIER.nom_Dossier,
+            DOSSIER.couleur_Dossier,
+            SOUS_DOSSIER.c.id_Dossier_Parent,
+        )
+        .join(A_ACCES, A_ACCES.c.id_Dossier == DOSSIER.id_Dossier)
+        .outerjoin(SOUS_DOSSIER, SOUS_DOSSIER.c.id_Dossier_Enfant == DOSSIER.id_Dossier)
+        .filter(A_ACCES.c.id_Role == role_id)
+        .order_by(DOSSIER.priorite_Dossier)
+        .all()
+    )
+    folders = {
+        folder_id: {"name": name, "color": color, "id": folder_id, "path": str(folder_id), "subfolder": []}
+        for folder_id, name, color, _ in rows
+    }
+    tree = []
+    for folder_id, _, _, parent_id in rows:
+        if parent_id is None:
+            tree.append(folders[folder_id])
+        elif parent_id in folders:
+            folders[parent_id]["subfolder"].append(folders[folder_id])
+    return tree
+
+def get_file_counts():
+    """
+    Get the total number of files and the number of indexed files.
+
+    Both counts are computed in a single query and cached in Redis for a second,
+    so that every web process receiving the same status message shares the result.
+
+    Returns:
+        tuple: The total number of files and the number of indexed files.
+    """
+    cached_counts = redis.mget("total_files", "total_files_processed")
+    if None not in cached_counts:
+        return tuple(int(count) for count in cached_counts)
+    total_files, total_files_processed = db.session.execute(
+        db.select(
+            db.func.count(),
+            db.func.coalesce(db.func.sum(db.case((FICHIER.est_Indexe_Fichier == 1, 1), else_=0)), 0),
+        ).select_from(FICHIER)
+    ).one()
+    with redis.pipeline() as pipeline:
+        pipeline.set("total_files", total_files, px=1000)
+        pipeline.set("total_files_processed", total_files_processed, px=1000)
+        pipeline.execute()
+    return total_files, total_files_processed
+
+def hash_password(password):
+    """
+    Hash a password with Argon2.
+
+    Args:
+        password (str): The password to hash.
+
+    Returns:
+        str: The Argon2 hash of the password.
+    """
+    return password_hasher.hash(password)
+
+def check_password(password_hash, password):
+    """
+    Check a password against its hash.
+
+    Argon2 hashes are verified with argon2-cffi, older bcrypt hashes with flask_bcrypt.
+
+    Args:
+        password_hash (str): The stored hash.
+        password (str): The password to check.
+
+    Returns:
+        bool: True if the password matches the hash, False otherwise.
+    """
+    if password_hash.startswith("$argon2"):
+        try:
+            return password_hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return check_password_hash(password_hash, password)
+
+def password_needs_rehash(password_hash):
+    """
+    Check if a password hash must be replaced by an Argon2 hash with the current parameters.
+
+    Args:
+        password_hash (str): The stored hash.
+
+    Returns:
+        bool: True if the hash is a bcrypt hash or uses outdated Argon2 parameters, False otherwise.
+    """
+    return not password_hash.startswith("$argon2") or password_hasher.check_needs_rehash(password_hash)
+
+def get_user(user_id):
+    """
+    Get a user, from the Redis cache when possible.
+
+    The cached row is attached to the session without querying the database. The password hash,
+    e-mail and phone number are left out of the cache and loaded from the database when accessed.
+
+    Args:
+        user_id (str): The ID of the user.
+
+    Returns:
+        UTILISATEUR: The user, or None if it does not exist.
+    """
+    cached_user = redis.get(f"user:{user_id}")
+    if cached_user is not None:
+        data = orjson.loads(cached_user)
+        data["id_Utilisateur"] = uuid.UUID(data["id_Utilisateur"])
+        user = UTILISATEUR(**data)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    user = UTILISATEUR.query.get(user_id)
+    if user is not None:
+        redis.set(f"user:{user_id}", orjson.dumps(user.to_dict_secure()), ex=60)
+    return user
+
+def invalidate_user(user_id):
+    """
+    Remove a user from the Redis cache, to be called after every change of the user.
+
+    Args:
+        user_id (str): The ID of the user.
+    """
+    redis.delete(f"user:{user_id}")
+
+@request_cached
+def get_favorite_ids(user_id):
+    """
+    Get the IDs of the files favorited by a user.
+
+    Args:
+        user_id (uuid.UUID): The ID of the user.
+
+    Returns:
+        set: The IDs of the favorite files.
+    """
+    return set(db.session.scalars(db.select(FAVORIS.c.id_Fichier).where(FAVORIS.c.id_Utilisateur == user_id)))
+
 def check_notitications():
     """Check if there is any notification in the database.
 
@@ -478,7 +895,7 @@ def check_notitications():
 
 def get_total_file_count(folder):
     """
-    Recursively calculates the total number of files in a given folder and its subfolders.
+    Calculates the total number of files in a given folder and its subfolders.
 
     Args:
         folder (Folder): The root folder to start counting from.
@@ -486,10 +903,7 @@ def get_total_file_count(folder):
     Returns:
         int: The total number of files in the folder and its subfolders.
     """
-    total = len(folder.FICHIER)
-    for subfolder in folder.DOSSIER_:
-        total += get_total_file_count(subfolder)
-    return total
+    return get_total_file_count_by_id(folder.id_Dossier)
 
 def get_total_file_count_by_id(folder_id):
     """
@@ -501,8 +915,15 @@ def get_total_file_count_by_id(folder_id):
     Returns:
     int: The total file count.
     """
-    folder = DOSSIER.query.filter_by(id_Dossier=folder_id).first()
-    return get_total_file_count(folder)
+    folder_ids = db.select(db.literal(folder_id).label("id_Dossier")).cte("folder_ids", recursive=True)
+    folder_ids = folder_ids.union_all(
+        db.select(SOUS_DOSSIER.c.id_Dossier_Enfant)
+        .where(SOUS_DOSSIER.c.id_Dossier_Parent == folder_ids.c.id_Dossier)
+    )
+    return db.session.scalar(
+        db.select(db.func.count(FICHIER.id_Fichier))
+        .where(FICHIER.id_Dossier.in_(db.select(folder_ids.c.id_Dossier)))
+    )
 
 class PasswordComplexity(object):
     def __init__(self, message=None):
@@ -512,14 +933,19 @@ class PasswordComplexity(object):
 
     def __call__(self, form, field):
         password = field.data
-        total = 0
-        if any(x.isupper() for x in password):
-            total += 1
-        if any(x.islower() for x in password):
-            total += 1
-        if any(x.isdigit() for x in password):
-            total += 1
-        if any(not x.isalnum() and not x.isspace() for x in password):
-            total += 1
-        if total < 3 or len(password) < 12:
+        if len(password) < 12:
+            raise ValidationError(self.message)
+        mask = 0
+        for x in password:
+            if x.isupper():
+                mask |= 1
+            elif x.islower():
+                mask |= 2
+            elif x.isdigit():
+                mask |= 4
+            elif not x.isalnum() and not x.isspace():
+                mask |= 8
+            if mask == 0b1111:
+                break
+        if bin(mask).count("1") < 3:
             raise ValidationError(self.message)
\ No newline at end of file